@@ -7,11 +7,27 @@
 Write a function that generates a single discrete time SIR model.
 """
 
+import functools
+import math
+import multiprocessing
 import numpy as np
-from scipy import stats
 import pandas as pd
 import collections
 
+# numba is optional, without it we fall back to the pure python simulation.
+# The compiled kernels draw from np.random.Generators, which needs numba>=0.56.
+try:
+  import numba
+except ImportError:
+  numba = None
+
+# Default generator for functions that take an optional rng. Pass an explicit
+# np.random.Generator to make simulations reproducible.
+_RNG = np.random.default_rng()
+
+# Number of candidate curves simulated at once when retrying stochastic fadeouts
+_RETRY_BATCH_SIZE = 32
+
 
 meta_data = collections.namedtuple('meta_data', [
     'num_epidemics', 'epidemic_id', 'frac_estimate_of_total',
@@ -81,7 +97,7 @@ ground_truth_cumulative_infections_over_time: a np.array representing the
 "non-predictive" cumsum of the ground truth simulation
 """
 
-def generate_ground_truth_SIR_curve(pop_size, beta, gamma):
+def generate_ground_truth_SIR_curve(pop_size, beta, gamma, rng=None):
   """
   A function that generates a single epidemic curve through time.
   We assume that the epidemic starts with a single case at time 0.  
@@ -93,37 +109,67 @@ def generate_ground_truth_SIR_curve(pop_size, beta, gamma):
     pop_size: an int representing the population size
     beta: a float representing the growth rate of the disease
     gamma: a float representing the recovery rate of the disease
+    rng: an optional np.random.Generator to draw from
   
   Returns:
     list_of_new_infections: a np.array of shape (T,) representing the ground
                             truth number of infected individuals as a function of time
   """
+  return generate_ground_truth_SIR_curve_precomputed(
+      pop_size, beta, 1.0 - math.exp(-gamma), rng)
+
+def generate_ground_truth_SIR_curve_precomputed(pop_size, beta, prob_recover,
+                                                rng=None):
+  """
+  Like generate_ground_truth_SIR_curve, but takes the per step probability of
+  recovery, 1 - exp(-gamma), so callers simulating many curves with the same
+  gamma only compute it once.
+
+  Args:
+    pop_size: an int representing the population size
+    beta: a float representing the growth rate of the disease
+    prob_recover: a float representing the probability that an infected
+                  individual recovers at each time step
+    rng: an optional np.random.Generator to draw from
+
+  Returns:
+    list_of_new_infections: a np.array of shape (T,) representing the ground
+                            truth number of infected individuals as a function of time
+  """
+  if rng is None:
+    rng = _RNG
+  if numba is not None:
+    # the compiled kernel needs an integer population, e.g. not 1e4
+    return _ground_truth_SIR_curve_numba(int(pop_size), beta, prob_recover,
+                                         rng)
+  return _ground_truth_SIR_curve_python(pop_size, beta, prob_recover, rng)
+
+def _ground_truth_SIR_curve_python(pop_size, beta, prob_recover, rng):
+  """Pure python implementation of generate_ground_truth_SIR_curve."""
   num_infected = 1 # always start with one infection at time 0
   num_recovered = 0
   num_susceptible = int(pop_size - num_infected - num_recovered)
 
-  list_of_new_infections = np.array([num_infected])
+  # a python list has amortized O(1) append, unlike np.append
+  list_of_new_infections = [num_infected]
 
   #While there are still infected people
   while num_infected > 0: 
     #Calculate the probability that a person becomes infected
-    #Python3 doesn't seem to work, so force a float 
-    frac_pop_infected = float(num_infected) / pop_size
-    prob_infected = 1 - np.exp(-beta*frac_pop_infected)
+    #math.exp is much cheaper than np.exp on scalars
+    frac_pop_infected = num_infected / pop_size
+    prob_infected = 1.0 - math.exp(-beta * frac_pop_infected)
     
     #Determine the number of new infections
     #By drawing from a binomial distribution 
-    num_new_infections = stats.binom.rvs(num_susceptible, prob_infected)
-
-    #Calculate the probability that a person recovers
-    prob_recover = 1 - np.exp(-gamma)
+    num_new_infections = rng.binomial(num_susceptible, prob_infected)
 
     #Determine the number of recoveries
     #by drawing from a binomial distribution
-    num_new_recoveries = stats.binom.rvs(num_infected, prob_recover)
+    num_new_recoveries = rng.binomial(num_infected, prob_recover)
 
     #Record the number of infections that occured at this time point
-    list_of_new_infections = np.append(list_of_new_infections, num_new_infections)
+    list_of_new_infections.append(int(num_new_infections))
 
     #update counts for next iteration
     #sum of all counts is constant and equal to population size
@@ -131,9 +177,80 @@ def generate_ground_truth_SIR_curve(pop_size, beta, gamma):
     num_recovered += num_new_recoveries
     num_susceptible -= num_new_infections
 
-  return list_of_new_infections
-
-def generate_observed_SIR_curves(percent_infected, pop_size, beta, gamma):
+  return np.asarray(list_of_new_infections, dtype=np.int64)
+
+if numba is not None:
+
+  @numba.njit(cache=True)
+  def _ground_truth_SIR_curve_numba(pop_size, beta, prob_recover, rng):
+    """Compiled implementation of generate_ground_truth_SIR_curve.
+
+    Draws from rng, a np.random.Generator, rather than numba's global
+    np.random state, so compiled code elsewhere keeps its own random stream.
+    """
+    num_infected = 1
+    num_susceptible = pop_size - num_infected
+
+    # grow the buffer by doubling, then trim it to the used length
+    list_of_new_infections = np.empty(64, dtype=np.int64)
+    list_of_new_infections[0] = num_infected
+    length = 1
+    while num_infected > 0:
+      prob_infected = 1.0 - math.exp(-beta * num_infected / pop_size)
+      num_new_infections = rng.binomial(num_susceptible, prob_infected)
+      num_new_recoveries = rng.binomial(num_infected, prob_recover)
+
+      if length == list_of_new_infections.shape[0]:
+        grown = np.empty(2 * length, dtype=np.int64)
+        grown[:length] = list_of_new_infections
+        list_of_new_infections = grown
+      list_of_new_infections[length] = num_new_infections
+      length += 1
+
+      num_infected = num_infected + num_new_infections - num_new_recoveries
+      num_susceptible -= num_new_infections
+
+    return list_of_new_infections[:length].copy()
+
+  @numba.njit(parallel=True, cache=True)
+  def _batch_ground_truth_SIR_curves_numba(pop_size, beta, prob_recover, rngs):
+    """Simulate one independent ground truth curve per generator in parallel.
+
+    A np.random.Generator isn't thread safe, so each curve needs its own.
+    """
+    curves = numba.typed.List()
+    for _ in range(len(rngs)):
+      curves.append(np.empty(0, dtype=np.int64))
+    for b in numba.prange(len(rngs)):
+      # prange indices are unsigned, typed lists are indexed by signed ints
+      i = np.int64(b)
+      curves[i] = _ground_truth_SIR_curve_numba(pop_size, beta, prob_recover,
+                                                rngs[i])
+    return curves
+
+def _candidate_SIR_curves(pop_size, beta, prob_recover, count, rng):
+  """Returns the next independent ground truth curves to try, given that
+  count curves have already faded out."""
+  if numba is not None:
+    # A batch runs until its longest candidate has ended, and the first
+    # candidate usually takes off, so start with a single curve. Only after
+    # fadeouts does the batch grow, doubling up to _RETRY_BATCH_SIZE.
+    if count == 0:
+      return [_ground_truth_SIR_curve_numba(int(pop_size), beta, prob_recover,
+                                            rng)]
+    batch_size = min(_RETRY_BATCH_SIZE, count, 5000 - count)
+    rngs = numba.typed.List([np.random.default_rng(seed) for seed in
+                             rng.integers(2**63, size=batch_size)])
+    return _batch_ground_truth_SIR_curves_numba(int(pop_size), beta,
+                                                prob_recover, rngs)
+  # Without numba, candidates are simulated one at a time. Advancing a batch
+  # with _ground_truth_SIR_curves_batched is slower here: the batch runs until
+  # its longest candidate has ended, while a fadeout only takes a few cheap
+  # scalar steps, and the first candidate usually takes off.
+  return [_ground_truth_SIR_curve_python(pop_size, beta, prob_recover, rng)]
+
+def generate_observed_SIR_curves(percent_infected, pop_size, beta, gamma,
+                                 rng=None):
   """
   Generate the epidemic curve observed to date using the SIR model.
 
@@ -143,6 +260,7 @@ def generate_observed_SIR_curves(percent_infected, pop_size, beta, gamma):
     pop_size: an int representing the population size
     beta: a float representing the growth rate of the disease
     gamma: a float representing the recovery rate of the disease
+    rng: an optional np.random.Generator to draw from
   
   Returns:
     observed_infections: a np.array of shape (T,) representing the number of
@@ -152,6 +270,30 @@ def generate_observed_SIR_curves(percent_infected, pop_size, beta, gamma):
                              of newly infectecd individuals over the course of 
                              the *whole* epidemic
   """
+  return generate_observed_SIR_curves_precomputed(
+      percent_infected, pop_size, beta, 1.0 - math.exp(-gamma), rng)
+
+def generate_observed_SIR_curves_precomputed(percent_infected, pop_size, beta,
+                                             prob_recover, rng=None):
+  """
+  Like generate_observed_SIR_curves, but takes the per step probability of
+  recovery, 1 - exp(-gamma), instead of gamma.
+
+  Args:
+    percent_infected: a float representing the percent of the population that
+                      has been infected at this point in time, for each epidemic
+    pop_size: an int representing the population size
+    beta: a float representing the growth rate of the disease
+    prob_recover: a float representing the probability that an infected
+                  individual recovers at each time step
+    rng: an optional np.random.Generator to draw from
+
+  Returns:
+    see generate_observed_SIR_curves
+  """
+  if rng is None:
+    rng = _RNG
+
   # We require that the total number of infections is >10
   # to eliminate stochastic fadeouts
   total_infections = 0
@@ -159,27 +301,221 @@ def generate_observed_SIR_curves(percent_infected, pop_size, beta, gamma):
   count = 0
     
   while total_infections < 10 and count<5000:
-    ground_truth_infections = generate_ground_truth_SIR_curve(pop_size, beta, gamma)
-    total_infections = np.sum(ground_truth_infections)
-    count += 1
+    # candidates are simulated in batches, take the first one that took off
+    for ground_truth_infections in _candidate_SIR_curves(
+        pop_size, beta, prob_recover, count, rng):
+      total_infections = np.sum(ground_truth_infections)
+      count += 1
+      if total_infections >= 10:
+        break
+
+  observed_infections = _observe_SIR_curve(ground_truth_infections,
+                                           total_infections, percent_infected)
+
+  return observed_infections, ground_truth_infections
 
+def _observe_SIR_curve(ground_truth_infections, total_infections,
+                       percent_infected):
+  """Truncates a ground truth curve to the part observed to date."""
   # calculate the target size for this epidemic
   target_size = total_infections * percent_infected
 
   # Find the current time, this is when the cumulative size of the model is still smaller than the target size
   # must be at least 2
+  # cumulative_infections is nondecreasing, so the last index still below the
+  # target can be found by binary search
   cumulative_infections = np.cumsum(ground_truth_infections)
-  current_time = np.max([np.max(np.where(cumulative_infections < target_size)), 2])
+  last_below_target = np.searchsorted(cumulative_infections, target_size,
+                                      side='left') - 1
+  current_time = max(int(last_below_target), 2)
 
   # Save list of infected individuals up until we reach the target_size
   # This is the 'history' of the epidemic up until the current time
   observed_infections = ground_truth_infections[:current_time]
 
-  return observed_infections, ground_truth_infections
+  return observed_infections
+
+def generate_ground_truth_SIR_curves_batched(pop_sizes, betas, gammas,
+                                             rng=None):
+  """
+  Generate many independent epidemic curves at once.
+  Equivalent to calling generate_ground_truth_SIR_curve for each epidemic, but
+  the (S, I, R) states of all epidemics are advanced together with vectorized
+  binomial draws, so the python loop runs once per time step rather than once
+  per time step per epidemic.
+
+  Args:
+    pop_sizes: an int or np.array of shape (M,) representing the population
+               sizes
+    betas: a float or np.array of shape (M,) representing the growth rates
+    gammas: a float or np.array of shape (M,) representing the recovery rates
+    rng: an optional np.random.Generator to draw from
+
+  Returns:
+    list_of_curves: a list of M np.arrays, each of shape (T_m,), representing
+                    the ground truth number of new infections of each epidemic
+                    as a function of time
+  """
+  if rng is None:
+    rng = _RNG
+  prob_recover = 1.0 - np.exp(-np.asarray(gammas, dtype=np.float64))
+  return _ground_truth_SIR_curves_batched(pop_sizes, betas, prob_recover, rng)
+
+def _ground_truth_SIR_curves_batched(pop_sizes, betas, prob_recover, rng):
+  """generate_ground_truth_SIR_curves_batched taking 1 - exp(-gammas)."""
+  pop_sizes, betas, prob_recover = np.broadcast_arrays(
+      np.atleast_1d(pop_sizes), np.atleast_1d(betas).astype(np.float64),
+      np.atleast_1d(prob_recover).astype(np.float64))
+  num_curves = pop_sizes.shape[0]
+
+  num_infected = np.ones(num_curves, dtype=np.int64)
+  num_susceptible = pop_sizes.astype(np.int64) - num_infected
+
+  # rows are epidemics, columns are time; grow the columns by doubling
+  new_infections = np.zeros((num_curves, 64), dtype=np.int64)
+  new_infections[:, 0] = num_infected
+  lengths = np.ones(num_curves, dtype=np.int64)
+
+  # only epidemics that still have infected people need to be advanced, and
+  # those have all been advanced at every step so far
+  active = np.arange(num_curves)
+  time = 1
+  while active.size:
+    if time == new_infections.shape[1]:
+      new_infections = np.concatenate(
+          [new_infections, np.zeros_like(new_infections)], axis=1)
+
+    infected = num_infected[active]
+    prob_infected = 1.0 - np.exp(-betas[active] * infected / pop_sizes[active])
+    num_new_infections = rng.binomial(num_susceptible[active], prob_infected)
+    num_new_recoveries = rng.binomial(infected, prob_recover[active])
+
+    new_infections[active, time] = num_new_infections
+    time += 1
+    lengths[active] = time
+
+    num_infected[active] = infected + num_new_infections - num_new_recoveries
+    num_susceptible[active] -= num_new_infections
+    active = active[num_infected[active] > 0]
+
+  return [new_infections[m, :lengths[m]] for m in range(num_curves)]
+
+def _generate_ground_truth_SIR_curves_took_off(pop_sizes, betas, prob_recover,
+                                               rng):
+  """
+  Batched counterpart of the stochastic fadeout rejection in
+  generate_observed_SIR_curves: epidemics with fewer than 10 infections are
+  re-simulated, up to 5000 attempts each.
+  """
+  curves = _ground_truth_SIR_curves_batched(pop_sizes, betas, prob_recover,
+                                            rng)
+  total_infections = np.array([curve.sum() for curve in curves])
+  pop_sizes, betas, prob_recover = np.broadcast_arrays(
+      np.atleast_1d(pop_sizes), np.atleast_1d(betas),
+      np.atleast_1d(prob_recover))
+  for _ in range(4999):
+    faded = np.flatnonzero(total_infections < 10)
+    if not faded.size:
+      break
+    retries = _ground_truth_SIR_curves_batched(
+        pop_sizes[faded], betas[faded], prob_recover[faded], rng)
+    for m, curve in zip(faded, retries):
+      curves[m] = curve
+      total_infections[m] = curve.sum()
+  return curves, total_infections
+
+def _prev_cumsum(x):
+  """Returns the "previous day" cumsum of x, i.e. [0, x0, x0 + x1, ...], and
+  the total of x, both along the last axis.
+
+  The cumsum is equivalent to np.cumsum(np.concatenate(([0.], x)))[:-1], but
+  is written straight into the output instead of allocating intermediates.
+  The total is then its last entry plus the last element of x, so x doesn't
+  need to be summed separately.
+  """
+  out = np.empty(x.shape, dtype=np.float64)
+  out[..., 0] = 0.
+  np.cumsum(x[..., :-1], axis=-1, out=out[..., 1:])
+  return out, out[..., -1] + x[..., -1]
+
+@functools.lru_cache(maxsize=1024)
+def _cached_arange(n):
+  """Returns np.arange(n), shared between all callers.
+
+  The array is read-only, so accidentally mutating a shared time axis raises
+  instead of silently changing other trajectories.
+  """
+  t = np.arange(n)
+  t.setflags(write=False)
+  return t
+
+def _pad_curves(curves):
+  """Stacks variable length curves into a zero padded (N, T_max) array.
+
+  Returns:
+    padded: a np.array of shape (N, T_max) with curve i in padded[i, :T_i]
+    lengths: a np.array of shape (N,) holding the length T_i of each curve
+  """
+  lengths = np.array([len(curve) for curve in curves], dtype=np.int64)
+  # initial=1 keeps an empty list of curves valid
+  padded = np.zeros((len(curves), lengths.max(initial=1)), dtype=np.int64)
+  for i, curve in enumerate(curves):
+    padded[i, :lengths[i]] = curve
+  return padded, lengths
+
+def _simulate_epidemics(task):
+  """
+  Simulates all the epidemics of one simulation. Defined at module level so
+  it can be sent to multiprocessing workers.
+
+  Args:
+    task: a tuple of (pop_sizes, betas, prob_recover, percent_infected, seed)
+          where seed is a np.random.SeedSequence
+  Returns:
+    observed: a list of the observed part of each epidemic
+    ground_truths: a list of the ground truth curve of each epidemic
+  """
+  pop_sizes, betas, prob_recover, percent_infected, seed = task
+  rng = np.random.default_rng(seed)
+  if numba is not None:
+    # a compiled curve per epidemic beats stepping them all together in numpy
+    curves = [
+        generate_observed_SIR_curves_precomputed(pct, pop_size, beta,
+                                                 prob_recover, rng)
+        for pct, pop_size, beta in zip(percent_infected.tolist(),
+                                       pop_sizes.astype(np.int64).tolist(),
+                                       np.asarray(betas).tolist())]
+    return [c[0] for c in curves], [c[1] for c in curves]
+
+  # without numba, simulate all the epidemics of this simulation at once
+  ground_truths, total_infections = _generate_ground_truth_SIR_curves_took_off(
+      pop_sizes, betas, prob_recover, rng)
+  observed = [
+      _observe_SIR_curve(ground_truth, total, pct)
+      for ground_truth, total, pct in zip(ground_truths, total_infections,
+                                          percent_infected.tolist())]
+  return observed, ground_truths
+
+def _pool_context():
+  """Returns the multiprocessing context to start simulation workers with.
+
+  Forking this process can hang it once numba has started its (e.g. TBB)
+  worker threads. Instead, workers are forked from a fork server, which
+  imports this module once and is then reused by every pool, so later pools
+  don't pay for importing the package (and with it tensorflow and jax) again.
+  Where there is no fork server, e.g. on Windows, workers are spawned.
+  """
+  if 'forkserver' not in multiprocessing.get_all_start_methods():
+    return multiprocessing.get_context('spawn')
+  context = multiprocessing.get_context('forkserver')
+  # only takes effect until the fork server has started
+  context.set_forkserver_preload([__name__])
+  return context
 
 def generate_SIR_simulations(gen_beta_fn, beta_gen_parameters, num_simulations, 
                              num_epidemics, constant_gamma=0.33, constant_pop_size=10000,
-                             const_estimate_of_total=0.5):
+                             const_estimate_of_total=0.5, rng=None,
+                             num_processes=1):
   """
   Generate many simulations of SIR curves.
   Each simulation contains num_epidemics.
@@ -195,60 +531,173 @@ def generate_SIR_simulations(gen_beta_fn, beta_gen_parameters, num_simulations,
     constant_gamma: a float representing the constant recovery rate (default 0.33)
     constant_pop_size: an int representing the constant population size (default 10000)
     const_estimate_of_total: a float representing the estimated fraction of the infection we've seen so far (default 1/2)
+    rng: an optional np.random.Generator to draw from. If given, it is also
+         passed on to gen_beta_fn as the rng keyword argument.
+    num_processes: an int representing the number of worker processes to
+                   spread the simulations over, e.g. os.cpu_count() (default 1,
+                   i.e. simulate in this process). Scripts using this need an
+                   if __name__ == '__main__' guard. The first call imports
+                   this package in a fork server, and every call starts its
+                   workers afresh (about 0.1s), each of which first loads the
+                   compiled kernels when using numba (about 0.3s). A
+                   simulation of 50 epidemics takes about 2ms with numba and
+                   4ms without, so this only pays off once a single process
+                   would take well over a second, e.g. for 1000 simulations.
   Returns:
     list_of_disease_trajectory: a list of disease_trajectory named tuples
   """
-  list_of_meta_data = [] 
-  list_of_disease_trajectory = [] 
+  simulations = generate_SIR_simulations_soa(
+      gen_beta_fn, beta_gen_parameters, num_simulations, num_epidemics,
+      constant_gamma=constant_gamma, constant_pop_size=constant_pop_size,
+      const_estimate_of_total=const_estimate_of_total, rng=rng,
+      num_processes=num_processes)
+  return soa_to_disease_trajectories(simulations)
+
+def generate_SIR_simulations_soa(gen_beta_fn, beta_gen_parameters,
+                                 num_simulations, num_epidemics,
+                                 constant_gamma=0.33, constant_pop_size=10000,
+                                 const_estimate_of_total=0.5, rng=None,
+                                 num_processes=1):
+  """
+  Like generate_SIR_simulations, but returns the trajectories column-wise.
 
+  Args:
+    see generate_SIR_simulations
+  Returns:
+    simulations: a dict keyed by the disease_trajectory field names. Each
+      value is a np.array whose first axis runs over the
+      N = num_simulations * num_epidemics trajectories, and 'v' has shape
+      (N, num_covariates). 'alpha' is shared by all trajectories.
+      The time series are zero padded to the longest trajectory, i.e.
+      'num_new_infections_over_time' and 'cumulative_infections_over_time'
+      have shape (N, T_max) and trajectory i is valid for its first
+      simulations['observed_length'][i] steps. Likewise the ground truth
+      series have shape (N, TT_max) with 'ground_truth_length'. 't' and
+      'ground_truth_t' are shared np.aranges of length T_max and TT_max.
+      Use soa_to_disease_trajectories to convert to disease_trajectories.
+  """
   # generate growth rate for all simulations,
   # this is constant between simulations 
-  beta, v, alpha = gen_beta_fn(*beta_gen_parameters)
+  # only pass rng when given so gen_beta_fn doesn't have to accept it
+  if rng is None:
+    beta, v, alpha = gen_beta_fn(*beta_gen_parameters)
+    rng = _RNG
+  else:
+    beta, v, alpha = gen_beta_fn(*beta_gen_parameters, rng=rng)
 
   # randomly generate the percentage of infected people for each epidemic
   # this is constant between simulations
-  percent_infected = np.random.uniform(0.05, 1.0, num_epidemics)
+  percent_infected = rng.uniform(0.05, 1.0, num_epidemics)
   
   # generate meta data for each epidemic
-  # TODO: do better
-  for i in range(num_epidemics):
-    md = meta_data(num_epidemics, i, const_estimate_of_total, percent_infected[i],
-                   constant_pop_size, beta[i], constant_gamma)
-    # I guess technically v and alpha should be in meta data...
-    list_of_meta_data.append(md)
-
-  unique_id = 0
-  for j in range(num_simulations):
-    for k in range(num_epidemics):
-      observed_infections, ground_truth_infections = generate_observed_SIR_curves(*list_of_meta_data[k][3:])
-      estimated_infections = np.sum(observed_infections)/list_of_meta_data[k].frac_estimate_of_total
-      total_infections = np.sum(ground_truth_infections)
-
-      t = np.arange(len(observed_infections))
-      ground_truth_t = np.arange(len(ground_truth_infections))
-      # previous day cumsums
-      cumulative_infections_over_time = np.cumsum(np.concatenate(([0.], observed_infections)))[:-1]
-      ground_truth_cumulative_infections_over_time = np.cumsum(np.concatenate(([0.], ground_truth_infections)))[:-1]
+  # tolist() converts to python floats up front instead of boxing numpy scalars
+  # one at a time
+  # I guess technically v and alpha should be in meta data...
+  list_of_meta_data = [
+      meta_data(num_epidemics, i, const_estimate_of_total, pct,
+                constant_pop_size, b, constant_gamma)
+      for i, (pct, b) in enumerate(zip(percent_infected.tolist(),
+                                       np.asarray(beta).tolist()))]
+
+  num_trajectories = num_simulations * num_epidemics
+  epidemic_number = np.tile(np.arange(num_epidemics), num_simulations)
+  # element-wise so numpy doesn't unpack the named tuples into a 2d array
+  metadata = np.empty(num_epidemics, dtype=object)
+  for i, md in enumerate(list_of_meta_data):
+    metadata[i] = md
+
+  # everything about an epidemic except its trajectory is constant between
+  # simulations, so look it up once
+  pop_sizes = np.full(num_epidemics, constant_pop_size)
+  # gamma is the same for every epidemic, so only compute this once
+  prob_recover = 1.0 - math.exp(-constant_gamma)
+
+  # simulations are independent, so each gets its own random stream; this
+  # makes the result independent of how they are spread over processes
+  seeds = np.random.SeedSequence(rng.integers(2**63)).spawn(num_simulations)
+  tasks = [(pop_sizes, beta, prob_recover, percent_infected, seed)
+           for seed in seeds]
+  if num_processes == 1:
+    results = map(_simulate_epidemics, tasks)
+  else:
+    chunksize = max(1, num_simulations // (4 * num_processes))
+    with _pool_context().Pool(processes=num_processes) as pool:
+      results = pool.map(_simulate_epidemics, tasks, chunksize=chunksize)
+      # let the workers exit rather than be terminated on leaving the block, so
+      # numba's (e.g. TBB) threading layer releases its semaphores
+      pool.close()
+      pool.join()
+
+  list_of_observed = []
+  list_of_ground_truth = []
+  for observed, ground_truths in results:
+    list_of_observed.extend(observed)
+    list_of_ground_truth.extend(ground_truths)
+
+  # one padded array per time series instead of one small array per trajectory
+  observed_infections, observed_length = _pad_curves(list_of_observed)
+  ground_truth_infections, ground_truth_length = _pad_curves(
+      list_of_ground_truth)
+  # previous day cumsums, the totals come for free as the last cumsum
+  cumulative_infections_over_time, observed_total = _prev_cumsum(
+      observed_infections)
+  ground_truth_cumulative_infections_over_time, total_infections = _prev_cumsum(
+      ground_truth_infections)
+
+  return {
+      'unique_id': np.arange(num_trajectories),
+      'simulation_number': np.repeat(np.arange(num_simulations), num_epidemics),
+      'epidemic_number': epidemic_number,
+      'num_new_infections_over_time': observed_infections,
+      'observed_length': observed_length,
+      'estimated_infections': observed_total/const_estimate_of_total,
+      'ground_truth_infections_over_time': ground_truth_infections,
+      'ground_truth_length': ground_truth_length,
+      'total_infections': total_infections.astype(np.int64),
+      'v': v.T[epidemic_number],
+      'alpha': alpha,
+      'metadata': metadata[epidemic_number],
+      't': _cached_arange(observed_infections.shape[1]),
+      'ground_truth_t': _cached_arange(ground_truth_infections.shape[1]),
+      'cumulative_infections_over_time': cumulative_infections_over_time,
+      'ground_truth_cumulative_infections_over_time': ground_truth_cumulative_infections_over_time,
       # these are "non-predictive" cumsums.
-      # cumulative_infections_over_time = np.cumsum(observed_infections)
-      # ground_truth_cumulative_infections_over_time = np.cumsum(ground_truth_infections)
-      dt = disease_trajectory(unique_id=unique_id, 
-                              simulation_number=j, 
-                              epidemic_number=k, 
-                              num_new_infections_over_time=observed_infections, 
-                              estimated_infections=estimated_infections,
-                              ground_truth_infections_over_time=ground_truth_infections,
-                              total_infections=total_infections, 
-                              v = v[:, k], 
-                              alpha = alpha, 
-                              metadata=list_of_meta_data[k],
-                              t=t,
-                              ground_truth_t = ground_truth_t,
-                              cumulative_infections_over_time=cumulative_infections_over_time,
-                              ground_truth_cumulative_infections_over_time=ground_truth_cumulative_infections_over_time)
-      list_of_disease_trajectory.append(dt)
-      unique_id += 1
-  
+      # 'cumulative_infections_over_time': np.cumsum(observed_infections, axis=1)
+      # 'ground_truth_cumulative_infections_over_time': np.cumsum(ground_truth_infections, axis=1)
+  }
+
+def soa_to_disease_trajectories(simulations):
+  """
+  Converts the output of generate_SIR_simulations_soa to disease_trajectories.
+
+  Args:
+    simulations: a dict as returned by generate_SIR_simulations_soa
+  Returns:
+    list_of_disease_trajectory: a list of disease_trajectory named tuples
+  """
+  # the time series are copied out of the padded arrays, so a kept trajectory
+  # doesn't hold on to all of them; trajectories of the same length share
+  # their (read-only) time axis
+  list_of_disease_trajectory = []
+  for i in range(len(simulations['unique_id'])):
+    n = int(simulations['observed_length'][i])
+    nn = int(simulations['ground_truth_length'][i])
+    dt = disease_trajectory(
+        unique_id=simulations['unique_id'][i],
+        simulation_number=simulations['simulation_number'][i],
+        epidemic_number=simulations['epidemic_number'][i],
+        num_new_infections_over_time=simulations['num_new_infections_over_time'][i, :n].copy(),
+        estimated_infections=simulations['estimated_infections'][i],
+        ground_truth_infections_over_time=simulations['ground_truth_infections_over_time'][i, :nn].copy(),
+        total_infections=simulations['total_infections'][i],
+        v=simulations['v'][i],
+        alpha=simulations['alpha'],
+        metadata=simulations['metadata'][i],
+        t=_cached_arange(n),
+        ground_truth_t=_cached_arange(nn),
+        cumulative_infections_over_time=simulations['cumulative_infections_over_time'][i, :n].copy(),
+        ground_truth_cumulative_infections_over_time=simulations['ground_truth_cumulative_infections_over_time'][i, :nn].copy())
+    list_of_disease_trajectory.append(dt)
   return list_of_disease_trajectory
 
 """# Generate Betas
@@ -256,54 +705,66 @@ def generate_SIR_simulations(gen_beta_fn, beta_gen_parameters, num_simulations,
 Three different ways of generating betas, depending on covariates
 """
 
-def generate_betas_from_single_random_covariate(num_epidemics):
+def generate_betas_from_single_random_covariate(num_epidemics, rng=None):
   """
   Betas depend on a single covariate that is randomly generated for each epidemic
 
   Args:
     num_epidemics: an int representing the number of epidemics to simulate
+    rng: an optional np.random.Generator to draw from
   Returns:
     beta: a np.array of shape (num_epidemics,) consisting of the growth rate for each epidemic
     v: a np.array of shape (1, num_epidemics) consisting of the randomly generated covariate for each epidemic
     alpha: a np.array of shape (num_covariates,) consisting of the weights for each covariate
   """
-  v = np.random.uniform(0.0, 1.0, (1, num_epidemics))
+  if rng is None:
+    rng = _RNG
+  v = rng.uniform(0.0, 1.0, (1, num_epidemics))
   alpha = np.ones(1)
-  beta = 0.4*np.exp(np.matmul(alpha, v))
+  # alpha is a single weight of 1, so alpha @ v is just v[0]
+  beta = 0.4*np.exp(v[0])
 
   return beta, v, alpha
 
-def generate_betas_effect_mod(num_epidemics):
+def generate_betas_effect_mod(num_epidemics, rng=None):
   '''Generate vector of betas depending on 2 discrete effects.
   Args: 
     num_epidemics: number of betas generated
+    rng: an optional np.random.Generator to draw from
   Returns:
     betas: a np.array of shape (num_epidemics,) consisting of the growth rate for each epidemic
     v: a np.array of shape (2, num_epidemics) consisting of the randomly generated covariate for each epidemic
     alpha: an empty np.array, consisting of the weights for each covariate
     #TODO: alpha should probably be ~identitiy to match form below
   '''
-  v = np.random.binomial(1, 0.5, size=(2, num_epidemics))
+  if rng is None:
+    rng = _RNG
+  v = rng.binomial(1, 0.5, size=(2, num_epidemics))
   hd = v[0, :]
   ws = v[1, :]
-  beta = np.exp(np.log(1.5) + np.log(2.0) * (hd == 1) * (ws == 0))
+  # v is 0/1, so beta is 1.5 * 2.0 when hd and not ws, and 1.5 otherwise
+  beta = np.where(hd & (1 - ws), 3.0, 1.5)
 
   return beta, v, np.array([])
 
-def generate_betas_many_cov2(num_epidemics, num_pred, num_not_pred):
+def generate_betas_many_cov2(num_epidemics, num_pred, num_not_pred, rng=None):
   '''Generate vector of betas with a real valued vector of covariates.
   Args: 
     num_epidemics: number of betas generated.
     num_pred: number of covariates that affect beta
     num_no_pred: number of covariates that do not affect beta
+    rng: an optional np.random.Generator to draw from
   Returns:
     betas: a np.array of shape (num_epidemics,) consisting of the growth rate for each epidemic
     v: a np.array of shape (num_covariates, num_epidemics) consisting of the randomly generated covariate for each epidemic
     alpha: np.array of shape (num_covariate,s) consisting of the weights for each covariate
   '''
+  if rng is None:
+    rng = _RNG
+
   #generate random covariates
   #sample from range -1, 1 uniformly
-  v = np.random.uniform(low=-1.0, high=1.0, size=(num_pred + num_not_pred, num_epidemics))
+  v = rng.uniform(low=-1.0, high=1.0, size=(num_pred + num_not_pred, num_epidemics))
 
   #construct weights for each covariate
   alpha_1 = np.ones(num_pred)
@@ -311,7 +772,7 @@ def generate_betas_many_cov2(num_epidemics, num_pred, num_not_pred):
   alpha = np.concatenate((alpha_1, alpha_0), axis=0)
 
   #this has a different functional form than we've seen before
-  beta = 1 + np.exp(np.matmul(alpha,v))
+  beta = 1 + np.exp(alpha @ v)
 
   return beta, v, alpha
 
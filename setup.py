@@ -4,5 +4,7 @@ setuptools.setup(
     name="EpiForecastStatMech",
     version="0.1",
     packages=setuptools.find_packages(),
-    install_requires=["numpy", "scipy", "pandas", "matplotlib", "seaborn", "tensorflow", "tensorflow_probability", "jax", "jaxlib", "glmnet_py"]
+    install_requires=["numpy", "scipy", "pandas", "matplotlib", "seaborn", "tensorflow", "tensorflow_probability", "jax", "jaxlib", "glmnet_py"],
+    # optional, compiles the SIR simulations in sir_sim
+    extras_require={"numba": ["numba>=0.56"]}
 )
@@ -1,7 +1,140 @@
+import subprocess
+import sys
+import textwrap
+import unittest
+from unittest import mock
+
 from absl.testing import absltest
+import numpy as np
 
 from epi_forecast_stat_mech import sir_sim
 
+# numba is an optional dependency, the compiled paths are only tested with it
+_NO_NUMBA = 'numba is not installed'
+
+
+class GenerateObservedSirCurves(absltest.TestCase):
+  """Each check runs on the compiled kernels and on the python fallback."""
+
+  def _check_observed_curves(self):
+    def simulate(seed):
+      return sir_sim.generate_observed_SIR_curves(
+          0.5, 10000, 1.5, 0.33, rng=np.random.default_rng(seed))
+    observed, ground_truth = simulate(0)
+    observed_again, ground_truth_again = simulate(0)
+    np.testing.assert_array_equal(observed, observed_again)
+    np.testing.assert_array_equal(ground_truth, ground_truth_again)
+    assert ground_truth.sum() >= 10
+    assert len(observed) >= 2
+    np.testing.assert_array_equal(observed, ground_truth[:len(observed)])
+
+  def _check_fadeouts_are_retried(self):
+    # with beta close to gamma most curves fade out before 10 infections
+    _, ground_truth = sir_sim.generate_observed_SIR_curves_precomputed(
+        0.5, 10000, 0.35, 1 - np.exp(-0.33), rng=np.random.default_rng(0))
+    assert ground_truth.sum() >= 10
+
+  def _check_ground_truth_curve(self):
+    curve = sir_sim.generate_ground_truth_SIR_curve(
+        1000, 2.0, 0.33, rng=np.random.default_rng(0))
+    curve_again = sir_sim.generate_ground_truth_SIR_curve(
+        1000, 2.0, 0.33, rng=np.random.default_rng(0))
+    np.testing.assert_array_equal(curve, curve_again)
+    assert curve[0] == 1
+    assert curve.sum() <= 1000
+
+  def _check_float_pop_size(self):
+    curve = sir_sim.generate_ground_truth_SIR_curve(
+        1e4, 1.5, 0.33, rng=np.random.default_rng(0))
+    assert curve.sum() <= 10000
+    trajectories = sir_sim.generate_SIR_simulations(
+        sir_sim.generate_betas_effect_mod, (5,), 1, 5, constant_pop_size=1e4)
+    assert len(trajectories) == 5
+
+  @unittest.skipIf(sir_sim.numba is None, _NO_NUMBA)
+  def test_observed_curves(self):
+    self._check_observed_curves()
+
+  def test_observed_curves_without_numba(self):
+    with mock.patch.object(sir_sim, 'numba', None):
+      self._check_observed_curves()
+
+  @unittest.skipIf(sir_sim.numba is None, _NO_NUMBA)
+  def test_fadeouts_are_retried(self):
+    self._check_fadeouts_are_retried()
+
+  def test_fadeouts_are_retried_without_numba(self):
+    with mock.patch.object(sir_sim, 'numba', None):
+      self._check_fadeouts_are_retried()
+
+  @unittest.skipIf(sir_sim.numba is None, _NO_NUMBA)
+  def test_ground_truth_curve(self):
+    self._check_ground_truth_curve()
+
+  def test_ground_truth_curve_without_numba(self):
+    with mock.patch.object(sir_sim, 'numba', None):
+      self._check_ground_truth_curve()
+
+  @unittest.skipIf(sir_sim.numba is None, _NO_NUMBA)
+  def test_float_pop_size(self):
+    self._check_float_pop_size()
+
+  def test_float_pop_size_without_numba(self):
+    with mock.patch.object(sir_sim, 'numba', None):
+      self._check_float_pop_size()
+
+  @unittest.skipIf(sir_sim.numba is None, _NO_NUMBA)
+  def test_numba_random_state_is_untouched(self):
+    seed = sir_sim.numba.njit(lambda s: np.random.seed(s))
+    draw = sir_sim.numba.njit(lambda: np.random.random())
+    seed(0)
+    expected = draw()
+    seed(0)
+    self._check_ground_truth_curve()
+    self._check_fadeouts_are_retried()
+    assert draw() == expected
+
+
+class ObserveSirCurve(absltest.TestCase):
+
+  def test_last_time_below_target(self):
+    # days without new infections repeat cumulative values:
+    # [1, 2, 3, 4, 6, 6, 6, 10]
+    ground_truth = np.array([1, 1, 1, 1, 2, 0, 0, 4])
+    cumulative = np.cumsum(ground_truth)
+    for percent_infected in (0.3, 0.45, 0.6, 0.7, 1.0):
+      # the original linear scan
+      expected = max(np.max(np.where(cumulative < 10 * percent_infected)), 2)
+      observed = sir_sim._observe_SIR_curve(ground_truth, 10, percent_infected)
+      np.testing.assert_array_equal(observed, ground_truth[:expected])
+    # the last day below a target of 6 is day 3, below 7 it is day 6
+    np.testing.assert_array_equal(
+        sir_sim._observe_SIR_curve(ground_truth, 10, 0.6), [1, 1, 1])
+    np.testing.assert_array_equal(
+        sir_sim._observe_SIR_curve(ground_truth, 10, 0.7), [1, 1, 1, 1, 2, 0])
+
+  def test_nothing_below_target(self):
+    # the linear scan raised a ValueError here, now at least 2 days are observed
+    observed = sir_sim._observe_SIR_curve(np.array([5, 3, 2]), 10, 0.2)
+    np.testing.assert_array_equal(observed, [5, 3])
+
+
+class PrevCumsum(absltest.TestCase):
+
+  def test_padded_rows(self):
+    for curves in ([np.array([1, 4, 2, 7]), np.array([3]), np.array([5, 0, 6])],
+                   [np.array([3]), np.array([2])]):
+      padded, _ = sir_sim._pad_curves(curves)
+      cumsum, total = sir_sim._prev_cumsum(padded)
+      for row, padded_row, curve in zip(cumsum, padded, curves):
+        np.testing.assert_array_equal(
+            row, np.cumsum(np.concatenate(([0.], padded_row)))[:-1])
+        # the zero padding doesn't change the curve's own part
+        np.testing.assert_array_equal(
+            row[:len(curve)], np.cumsum(np.concatenate(([0.], curve)))[:-1])
+      np.testing.assert_array_equal(total, padded.sum(-1))
+      np.testing.assert_array_equal(total, [curve.sum() for curve in curves])
+
 
 class GenerateSirSimulations(absltest.TestCase):
 
@@ -15,3 +148,77 @@ class GenerateSirSimulations(absltest.TestCase):
         (num_epidemics, num_important_cov, num_unimportant_cov),
         num_simulations, num_epidemics, constant_pop_size=10000)
     assert len(trajectories) == num_epidemics
+
+  def test_soa_matches_trajectories(self):
+    num_simulations = 2
+    num_epidemics = 5
+    simulations = sir_sim.generate_SIR_simulations_soa(
+        sir_sim.generate_betas_many_cov2, (num_epidemics, 1, 2),
+        num_simulations, num_epidemics)
+    trajectories = sir_sim.soa_to_disease_trajectories(simulations)
+    assert len(trajectories) == num_simulations * num_epidemics
+    assert simulations['v'].shape == (num_simulations * num_epidemics, 3)
+    for i, dt in enumerate(trajectories):
+      assert dt.unique_id == i
+      assert dt.simulation_number == i // num_epidemics
+      assert dt.epidemic_number == i % num_epidemics
+      assert dt.metadata.epidemic_id == dt.epidemic_number
+      assert dt.total_infections == dt.ground_truth_infections_over_time.sum()
+      assert len(dt.t) == len(dt.num_new_infections_over_time)
+
+  def test_rng_is_reproducible(self):
+    num_epidemics = 5
+    def simulate(seed):
+      return sir_sim.generate_SIR_simulations_soa(
+          sir_sim.generate_betas_effect_mod, (num_epidemics,), 2,
+          num_epidemics, rng=np.random.default_rng(seed))
+    first = simulate(0)
+    second = simulate(0)
+    np.testing.assert_array_equal(first['v'], second['v'])
+    np.testing.assert_array_equal(first['total_infections'],
+                                  second['total_infections'])
+
+  def test_batched_curves(self):
+    pop_sizes = np.array([100, 1000, 10000])
+    curves = sir_sim.generate_ground_truth_SIR_curves_batched(
+        pop_sizes, np.array([1.5, 2.0, 3.0]), 0.33,
+        rng=np.random.default_rng(0))
+    assert len(curves) == len(pop_sizes)
+    for curve, pop_size in zip(curves, pop_sizes):
+      assert curve[0] == 1
+      assert curve.sum() <= pop_size
+
+  def test_num_processes_does_not_change_result(self):
+    num_epidemics = 5
+    def simulate(num_processes):
+      return sir_sim.generate_SIR_simulations_soa(
+          sir_sim.generate_betas_effect_mod, (num_epidemics,), 4,
+          num_epidemics, rng=np.random.default_rng(0),
+          num_processes=num_processes)
+    serial = simulate(1)
+    pooled = simulate(2)
+    np.testing.assert_array_equal(serial['total_infections'],
+                                  pooled['total_infections'])
+
+  @unittest.skipIf(sir_sim.numba is None, _NO_NUMBA)
+  def test_num_processes_after_numba_threads(self):
+    # forking a process in which numba's (e.g. TBB) threads have run can hang
+    # it at exit, so check in a fresh interpreter that it still exits
+    script = textwrap.dedent("""
+        import numpy as np
+        from epi_forecast_stat_mech import sir_sim
+        if __name__ == '__main__':
+          # fadeouts are retried in parallel, which starts numba's threads
+          sir_sim.generate_observed_SIR_curves(
+              0.5, 10000, 0.35, 0.33, rng=np.random.default_rng(0))
+          sir_sim.generate_SIR_simulations(
+              sir_sim.generate_betas_effect_mod, (5,), 4, 5, num_processes=2)
+        """)
+    subprocess.run([sys.executable, '-c', script], check=True, timeout=300)
+
+  def test_empty(self):
+    for num_simulations, num_epidemics in ((0, 5), (2, 0)):
+      trajectories = sir_sim.generate_SIR_simulations(
+          sir_sim.generate_betas_many_cov2, (num_epidemics, 1, 2),
+          num_simulations, num_epidemics)
+      assert trajectories == []